@@ -87,7 +87,7 @@ class EdgeDecoder(nn.Module):
         edge_features = torch.cat([z_src, z_dst], dim=-1)
 
         # Pass through MLP
-        out = self.mlp(edge_features).squeeze()
+        out = self.mlp(edge_features).squeeze(-1)
 
         return out
 
@@ -12,16 +12,51 @@ Input:
 
 Output:
     - data/processed/knowledge_base.json
+    - data/processed/{entities,relationships}.parquet (with --format parquet)
     - data/processed/week2_quality_report.json
 """
 
-import json
+import orjson
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
 import argparse
 
 
+# Columns used downstream, with explicit dtypes so pandas skips type inference.
+# PMID lists are forced to str so a single PMID is not parsed as an integer.
+ENTITY_DTYPES = {
+    'entity_id': str,
+    'entity_text': str,
+    'entity_type': 'category',
+    'frequency': 'int32',
+    'num_papers': 'int32',
+    'source_pmids': str
+}
+
+RELATIONSHIP_DTYPES = {
+    'relationship_id': str,
+    'drug_id': str,
+    'drug_text': str,
+    'disease_id': str,
+    'disease_text': str,
+    'relationship_type': 'category',
+    'confidence': 'float64',
+    'evidence_text': str,
+    'evidence_pmids': str,
+    'num_papers': 'int32',
+    'extraction_methods': str
+}
+
+
+def split_list_column(series):
+    """Split a comma-separated string column into lists ([] for missing values)."""
+    split = series.fillna('').str.split(',')
+    empty = pd.Series([[] for _ in range(len(series))], index=series.index, dtype=object)
+    return split.where(series.notna(), empty)
+
+
 class KnowledgeBaseBuilder:
     """Build unified knowledge base from entities and relationships."""
 
@@ -29,45 +64,75 @@ class KnowledgeBaseBuilder:
         self.entities_df = None
         self.relationships_df = None
         self.kb = None
+        self._integrity_ok = None
+        self._entity_groups = None
 
     def load_data(self, entities_path, relationships_path):
         """Load entities and relationships from CSV files."""
         print(f"\n📖 Loading data...")
-        self.entities_df = pd.read_csv(entities_path)
-        self.relationships_df = pd.read_csv(relationships_path)
+        self.entities_df = pd.read_csv(
+            entities_path, engine='pyarrow',
+            usecols=list(ENTITY_DTYPES), dtype=ENTITY_DTYPES
+        )
+        self.relationships_df = pd.read_csv(
+            relationships_path, engine='pyarrow',
+            usecols=list(RELATIONSHIP_DTYPES), dtype=RELATIONSHIP_DTYPES
+        )
+        self._integrity_ok = None
+        self._entity_groups = None
 
         print(f"✅ Loaded {len(self.entities_df)} entities")
         print(f"✅ Loaded {len(self.relationships_df)} relationships")
 
+    def split_entities_by_type(self):
+        """Split entities into (drugs_df, diseases_df) with a single groupby pass."""
+        if self._entity_groups is None:
+            groups = dict(tuple(self.entities_df.groupby('entity_type', observed=True)))
+            empty = self.entities_df.iloc[:0]
+            self._entity_groups = (groups.get('CHEMICAL', empty), groups.get('DISEASE', empty))
+
+        return self._entity_groups
+
     def validate_integrity(self):
-        """Validate referential integrity between entities and relationships."""
+        """Validate referential integrity between entities and relationships (memoized)."""
+        if self._integrity_ok is not None:
+            return self._integrity_ok
+
         print(f"\n🔍 Validating referential integrity...")
 
         # Get all entity IDs
-        entity_ids = set(self.entities_df['entity_id'])
-
-        # Check relationships reference valid entities
-        invalid_drugs = []
-        invalid_diseases = []
-
-        for _, rel in self.relationships_df.iterrows():
-            if rel['drug_id'] not in entity_ids:
-                invalid_drugs.append(rel['drug_id'])
-            if rel['disease_id'] not in entity_ids:
-                invalid_diseases.append(rel['disease_id'])
-
-        if invalid_drugs or invalid_diseases:
-            print(f"⚠️  Found {len(set(invalid_drugs))} invalid drug IDs")
-            print(f"⚠️  Found {len(set(invalid_diseases))} invalid disease IDs")
-            return False
+        entity_ids = pd.Index(self.entities_df['entity_id'])
+
+        # Check relationships reference valid entities (vectorized)
+        bad_drugs = ~self.relationships_df['drug_id'].isin(entity_ids)
+        bad_diseases = ~self.relationships_df['disease_id'].isin(entity_ids)
+
+        invalid_drugs = self.relationships_df.loc[bad_drugs, 'drug_id'].unique()
+        invalid_diseases = self.relationships_df.loc[bad_diseases, 'disease_id'].unique()
+
+        if len(invalid_drugs) or len(invalid_diseases):
+            print(f"⚠️  Found {len(invalid_drugs)} invalid drug IDs")
+            print(f"⚠️  Found {len(invalid_diseases)} invalid disease IDs")
+            self._integrity_ok = False
         else:
             print(f"✅ All relationships reference valid entities")
-            return True
+            self._integrity_ok = True
+
+        return self._integrity_ok
+
+    def build_knowledge_base(self, include_records=True):
+        """
+        Build unified knowledge base structure.
 
-    def build_knowledge_base(self):
-        """Build unified knowledge base structure."""
+        Args:
+            include_records: Materialize entities/relationships as lists of
+                dictionaries. Set to False when the tables are persisted as
+                Parquet, in which case only the metadata is built.
+        """
         print(f"\n🏗️  Building knowledge base...")
 
+        drugs_df, diseases_df = self.split_entities_by_type()
+
         # Create metadata
         metadata = {
             'created_date': datetime.now().isoformat(),
@@ -76,41 +141,41 @@ class KnowledgeBaseBuilder:
             'extraction_method': 'BC5CDR biomedical NER + pattern matching + co-occurrence',
             'statistics': {
                 'total_entities': len(self.entities_df),
-                'drugs': len(self.entities_df[self.entities_df['entity_type'] == 'CHEMICAL']),
-                'diseases': len(self.entities_df[self.entities_df['entity_type'] == 'DISEASE']),
+                'drugs': len(drugs_df),
+                'diseases': len(diseases_df),
                 'relationships': len(self.relationships_df),
                 'source_papers': 924
             }
         }
 
+        if not include_records:
+            self.kb = {'metadata': metadata}
+            print(f"✅ Knowledge base metadata created")
+            return self.kb
+
         # Convert entities to list of dictionaries
-        entities = []
-        for _, entity in self.entities_df.iterrows():
-            entities.append({
-                'id': entity['entity_id'],
-                'text': entity['entity_text'],
-                'type': entity['entity_type'],
-                'frequency': int(entity['frequency']),
-                'num_papers': int(entity['num_papers']),
-                'source_pmids': entity['source_pmids'].split(',') if pd.notna(entity['source_pmids']) else []
-            })
+        entities = (
+            self.entities_df
+            .assign(source_pmids=split_list_column(self.entities_df['source_pmids']))
+            .rename(columns={'entity_id': 'id', 'entity_text': 'text', 'entity_type': 'type'})
+            [['id', 'text', 'type', 'frequency', 'num_papers', 'source_pmids']]
+            .astype({'frequency': int, 'num_papers': int})
+            .to_dict('records')
+        )
 
         # Convert relationships to list of dictionaries
-        relationships = []
-        for _, rel in self.relationships_df.iterrows():
-            relationships.append({
-                'id': rel['relationship_id'],
-                'drug_id': rel['drug_id'],
-                'drug_text': rel['drug_text'],
-                'disease_id': rel['disease_id'],
-                'disease_text': rel['disease_text'],
-                'type': rel['relationship_type'],
-                'confidence': float(rel['confidence']),
-                'evidence_text': rel['evidence_text'],
-                'evidence_pmids': rel['evidence_pmids'].split(',') if pd.notna(rel['evidence_pmids']) else [],
-                'num_papers': int(rel['num_papers']),
-                'extraction_methods': rel['extraction_methods'].split(',') if pd.notna(rel['extraction_methods']) else []
-            })
+        relationships = (
+            self.relationships_df
+            .assign(
+                evidence_pmids=split_list_column(self.relationships_df['evidence_pmids']),
+                extraction_methods=split_list_column(self.relationships_df['extraction_methods'])
+            )
+            .rename(columns={'relationship_id': 'id', 'relationship_type': 'type'})
+            [['id', 'drug_id', 'drug_text', 'disease_id', 'disease_text', 'type', 'confidence',
+              'evidence_text', 'evidence_pmids', 'num_papers', 'extraction_methods']]
+            .astype({'confidence': float, 'num_papers': int})
+            .to_dict('records')
+        )
 
         # Build knowledge base
         self.kb = {
@@ -122,13 +187,31 @@ class KnowledgeBaseBuilder:
         print(f"✅ Knowledge base created")
         return self.kb
 
+    def save_parquet(self, output_dir):
+        """
+        Persist entities and relationships as zstd-compressed Parquet tables.
+
+        Returns:
+            Dictionary mapping table name to the written file path
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        paths = {
+            'entities': output_dir / 'entities.parquet',
+            'relationships': output_dir / 'relationships.parquet'
+        }
+        self.entities_df.to_parquet(paths['entities'], compression='zstd', index=False)
+        self.relationships_df.to_parquet(paths['relationships'], compression='zstd', index=False)
+
+        return {name: str(path) for name, path in paths.items()}
+
     def generate_quality_report(self):
         """Generate comprehensive quality report for Week 2."""
         print(f"\n📊 Generating quality report...")
 
         # Entity statistics
-        drugs_df = self.entities_df[self.entities_df['entity_type'] == 'CHEMICAL']
-        diseases_df = self.entities_df[self.entities_df['entity_type'] == 'DISEASE']
+        drugs_df, diseases_df = self.split_entities_by_type()
 
         entity_stats = {
             'total': len(self.entities_df),
@@ -143,14 +226,12 @@ class KnowledgeBaseBuilder:
         }
 
         # Relationship statistics
+        conf = self.relationships_df['confidence'].to_numpy()
         rel_stats = {
             'total': len(self.relationships_df),
-            'high_confidence': len(self.relationships_df[self.relationships_df['confidence'] >= 0.8]),
-            'medium_confidence': len(self.relationships_df[
-                (self.relationships_df['confidence'] >= 0.5) &
-                (self.relationships_df['confidence'] < 0.8)
-            ]),
-            'low_confidence': len(self.relationships_df[self.relationships_df['confidence'] < 0.5]),
+            'high_confidence': int(np.count_nonzero(conf >= 0.8)),
+            'medium_confidence': int(np.count_nonzero((conf >= 0.5) & (conf < 0.8))),
+            'low_confidence': int(np.count_nonzero(conf < 0.5)),
             'avg_confidence': float(self.relationships_df['confidence'].mean()),
             'avg_papers_per_relationship': float(self.relationships_df['num_papers'].mean()),
             'top_relationships': self.relationships_df.head(10)[
@@ -161,8 +242,8 @@ class KnowledgeBaseBuilder:
         # Validation checks
         validation = {
             'referential_integrity': self.validate_integrity(),
-            'no_null_entities': int(self.entities_df['entity_text'].isnull().sum()) == 0,
-            'no_null_relationships': int(self.relationships_df['drug_id'].isnull().sum()) == 0,
+            'no_null_entities': int(self.entities_df['entity_text'].isna().sum()) == 0,
+            'no_null_relationships': int(self.relationships_df['drug_id'].isna().sum()) == 0,
             'valid_confidence_range': bool(
                 (self.relationships_df['confidence'] >= 0).all() and
                 (self.relationships_df['confidence'] <= 1).all()
@@ -222,10 +303,13 @@ def main():
                        help='Input CSV file with relationships')
     parser.add_argument('--output', type=str,
                        default='data/processed/knowledge_base.json',
-                       help='Output JSON file for knowledge base')
+                       help='Output JSON file for knowledge base (metadata only with --format parquet)')
     parser.add_argument('--report', type=str,
                        default='data/processed/week2_quality_report.json',
                        help='Output JSON file for quality report')
+    parser.add_argument('--format', type=str, choices=['json', 'parquet'],
+                       default='json',
+                       help='Knowledge base format: full JSON, or Parquet tables next to --output')
 
     args = parser.parse_args()
 
@@ -239,11 +323,8 @@ def main():
     # Load data
     builder.load_data(args.entities, args.relationships)
 
-    # Validate integrity
-    builder.validate_integrity()
-
-    # Build knowledge base
-    kb = builder.build_knowledge_base()
+    # Build knowledge base (Parquet keeps the tables columnar, no record dicts)
+    kb = builder.build_knowledge_base(include_records=(args.format == 'json'))
 
     # Generate quality report
     report = builder.generate_quality_report()
@@ -255,13 +336,18 @@ def main():
     Path(args.output).parent.mkdir(parents=True, exist_ok=True)
 
     # Save knowledge base
-    with open(args.output, 'w') as f:
-        json.dump(kb, f, indent=2)
+    if args.format == 'parquet':
+        kb['tables'] = builder.save_parquet(Path(args.output).parent)
+        for name, path in kb['tables'].items():
+            print(f"✅ {name.capitalize()} saved to {path}")
+
+    with open(args.output, 'wb') as f:
+        f.write(orjson.dumps(kb, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     print(f"✅ Knowledge base saved to {args.output}")
 
     # Save quality report
-    with open(args.report, 'w') as f:
-        json.dump(report, f, indent=2)
+    with open(args.report, 'wb') as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     print(f"✅ Quality report saved to {args.report}")
 
     # Print summary
@@ -280,6 +366,8 @@ def main():
     print(f"\nCoverage:")
     print(f"  Drugs:        {report['coverage']['drug_coverage_pct']:.1f}%")
     print(f"  Diseases:     {report['coverage']['disease_coverage_pct']:.1f}%")
+    print(f"\nValidation:")
+    print(f"  Referential integrity: {report['validation']['referential_integrity']} {'✅' if report['validation']['referential_integrity'] else '❌'}")
     print(f"\nSuccess Criteria:")
     print(f"  Entities target:       {report['success_criteria']['target_met']} ✅" if report['success_criteria']['target_met'] else f"  Entities target:       {report['success_criteria']['target_met']} ❌")
     print(f"  Relationships target:  {report['success_criteria']['relationships_target_met']} {'✅' if report['success_criteria']['relationships_target_met'] else '⚠️  (close)'}")
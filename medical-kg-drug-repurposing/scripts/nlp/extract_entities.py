@@ -5,6 +5,8 @@ Extract drugs (CHEMICAL) and diseases (DISEASE) from PubMed abstracts using BC5C
 
 Usage:
     python scripts/nlp/extract_entities.py
+    python scripts/nlp/extract_entities.py --gpu  # requires: pip install spacy[cuda12x]
+    python scripts/nlp/extract_entities.py --model path/to/model  # any spaCy pipeline with CHEMICAL/DISEASE NER
 
 Input:
     - data/raw/pubmed_abstracts.json (924 abstracts)
@@ -12,34 +14,95 @@ Input:
 Output:
     - data/processed/entities.csv
     - data/processed/entity_extraction_stats.json
+    - data/processed/abstracts.docbin (NER cache reused by extract_relationships.py)
 """
 
+import ijson
 import json
+import numpy as np
 import pandas as pd
 import spacy
+from spacy.tokens import DocBin
 from collections import defaultdict
+from operator import itemgetter
 from pathlib import Path
 from tqdm import tqdm
 import argparse
+import os
+import sys
 from datetime import datetime
 
 
+# Only the NER component is used; skipping the rest roughly halves per-doc cost
+UNUSED_COMPONENTS = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer']
+
+# Token annotations kept in the DocBin cache: entities for extraction and
+# sentence boundaries for the relationship Matcher
+DOCBIN_ATTRS = ['ENT_IOB', 'ENT_TYPE', 'SENT_START']
+
+# Stands in for a missing or non-numeric PMID; such mentions still count
+# towards frequency but are left out of source_pmids
+INVALID_PMID = -1
+
+
+def count_abstracts(path):
+    """Count the abstracts in a JSON array file without materializing them."""
+    with open(path, 'rb') as f:
+        return sum(1 for prefix, event, _ in ijson.parse(f)
+                   if prefix == 'item' and event == 'start_map')
+
+
+def stream_abstracts(path):
+    """Yield abstract dictionaries one at a time from a JSON array file."""
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'item')
+
+
+def docbin_meta_path(docbin_path):
+    """Path of the JSON file recording which model produced a DocBin cache."""
+    return Path(f"{docbin_path}.meta.json")
+
+
+def parse_pmid(value):
+    """Return a PMID as a positive int, or INVALID_PMID if missing/non-numeric."""
+    try:
+        pmid = int(value)
+    except (TypeError, ValueError):
+        return INVALID_PMID
+    return pmid if pmid > 0 else INVALID_PMID
+
+
 class EntityExtractor:
     """Extract biomedical entities from PubMed abstracts using BC5CDR model."""
 
-    def __init__(self, model_name='en_ner_bc5cdr_md'):
-        """Initialize the BC5CDR NER model."""
+    def __init__(self, model_name='en_ner_bc5cdr_md', gpu=False, cache_docs=False):
+        """
+        Initialize the BC5CDR NER model.
+
+        Args:
+            model_name: spaCy model name or path to a trained pipeline directory
+            gpu: Run the model on GPU if one is available (requires spacy[cuda12x])
+            cache_docs: Keep the parser enabled so cached Docs carry the same
+                sentence boundaries extract_relationships.py would compute
+        """
+        if gpu:
+            print(f"GPU: {'enabled' if spacy.prefer_gpu() else 'not available, using CPU'}")
+
+        disabled = [name for name in UNUSED_COMPONENTS
+                    if not (cache_docs and name == 'parser')]
+
         print(f"Loading {model_name} model...")
         try:
-            self.nlp = spacy.load(model_name)
+            self.nlp = spacy.load(model_name, disable=disabled)
             print(f"✅ Model loaded successfully")
         except OSError:
             print(f"❌ Model {model_name} not found. Installing...")
             import subprocess
             subprocess.run(['pip', 'install',
                           'https://s3-us-west-2.amazonaws.com/ai2-s2-scispacy/releases/v0.5.1/en_ner_bc5cdr_md-0.5.1.tar.gz'])
-            self.nlp = spacy.load(model_name)
+            self.nlp = spacy.load(model_name, disable=disabled)
             print(f"✅ Model installed and loaded")
+        print(f"   Active pipeline: {self.nlp.pipe_names}")
 
     def extract_from_text(self, text, pmid):
         """
@@ -56,8 +119,19 @@ class EntityExtractor:
             return []
 
         # Process text with NER model
-        doc = self.nlp(text)
+        return self.extract_from_doc(self.nlp(text), pmid)
 
+    def extract_from_doc(self, doc, pmid):
+        """
+        Extract entities from an already-processed spaCy Doc.
+
+        Args:
+            doc: spaCy Doc with NER annotations
+            pmid: PubMed ID
+
+        Returns:
+            List of (entity_text, entity_type, pmid) tuples
+        """
         entities = []
         for ent in doc.ents:
             # Normalize entity text (lowercase, strip whitespace)
@@ -70,40 +144,63 @@ class EntityExtractor:
 
         return entities
 
-    def extract_from_abstracts(self, abstracts):
+    def extract_from_abstracts(self, abstracts, batch_size=64, n_process=1, doc_bin=None,
+                               num_abstracts=None):
         """
         Extract entities from all abstracts.
 
+        Abstracts are streamed through nlp.pipe() so spaCy can batch the
+        model forward passes instead of processing one document at a time.
+
         Args:
-            abstracts: List of abstract dictionaries
+            abstracts: List or stream of abstract dictionaries
+            batch_size: Number of abstracts per nlp.pipe() batch
+            n_process: Number of worker processes for nlp.pipe(). Values > 1
+                spawn workers on macOS/Windows, so callers must sit behind an
+                `if __name__ == '__main__':` guard
+            doc_bin: Optional DocBin that every processed Doc is added to
+            num_abstracts: Abstract count for progress reporting (required
+                when abstracts is a stream rather than a list)
 
         Returns:
-            Dictionary mapping (entity_text, entity_type) -> {pmids: set, frequency: int}
+            Dictionary mapping (entity_text, entity_type) -> list of int PMIDs,
+            one per mention (so the list length is the mention frequency);
+            abstracts without a valid PMID contribute INVALID_PMID
         """
-        print(f"\n🔬 Processing {len(abstracts)} abstracts...")
+        if num_abstracts is None:
+            num_abstracts = len(abstracts)
+        print(f"\n🔬 Processing {num_abstracts} abstracts...")
 
         # Dictionary to store entity information
         # Key: (entity_text, entity_type)
-        # Value: {'pmids': set(), 'frequency': int}
-        entity_data = defaultdict(lambda: {'pmids': set(), 'frequency': 0})
+        # Value: list of int64-encodable PMIDs, deduplicated at DataFrame build time
+        entity_data = defaultdict(list)
 
-        # Process each abstract
-        for abstract in tqdm(abstracts, desc="Extracting entities"):
-            pmid = abstract.get('pmid', 'unknown')
-            title = abstract.get('title', '')
-            abstract_text = abstract.get('abstract', '')
+        # Combine title and abstract for better coverage
+        texts = (
+            (f"{abstract.get('title', '')}. {abstract.get('abstract', '')}", parse_pmid(abstract.get('pmid')))
+            for abstract in abstracts
+        )
+        docs = self.nlp.pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process)
 
-            # Combine title and abstract for better coverage
-            full_text = f"{title}. {abstract_text}"
+        # Process each abstract
+        invalid_pmids = 0
+        for doc, pmid in tqdm(docs, total=num_abstracts, desc="Extracting entities"):
+            if pmid == INVALID_PMID:
+                invalid_pmids += 1
+            if doc_bin is not None:
+                doc_bin.add(doc)
 
             # Extract entities
-            entities = self.extract_from_text(full_text, pmid)
+            entities = self.extract_from_doc(doc, pmid)
 
             # Update entity dictionary
             for entity_text, entity_type, entity_pmid in entities:
-                key = (entity_text, entity_type)
-                entity_data[key]['pmids'].add(entity_pmid)
-                entity_data[key]['frequency'] += 1
+                entity_data[(sys.intern(entity_text), entity_type)].append(entity_pmid)
+
+        if invalid_pmids:
+            print(f"⚠️  {invalid_pmids} abstracts have a missing or non-numeric PMID; "
+                  f"their entities are counted but not listed in source_pmids")
 
         return entity_data
 
@@ -117,38 +214,41 @@ class EntityExtractor:
         Returns:
             DataFrame with columns: entity_id, entity_text, entity_type, frequency, source_pmids
         """
-        rows = []
-
-        # Sort by frequency (descending) for consistent ordering
-        sorted_entities = sorted(entity_data.items(),
-                                key=lambda x: x[1]['frequency'],
-                                reverse=True)
-
-        for idx, ((entity_text, entity_type), data) in enumerate(sorted_entities, 1):
-            # Create entity ID with type prefix
-            prefix = 'DRUG' if entity_type == 'CHEMICAL' else 'DISEASE'
-            entity_id = f"{prefix}_{idx:04d}"
-
-            # Convert pmid set to comma-separated string
-            source_pmids = ','.join(sorted(data['pmids']))
-
-            rows.append({
-                'entity_id': entity_id,
-                'entity_text': entity_text,
-                'entity_type': entity_type,
-                'frequency': data['frequency'],
-                'source_pmids': source_pmids,
-                'num_papers': len(data['pmids'])
-            })
-
-        return pd.DataFrame(rows)
-
-    def generate_statistics(self, df, abstracts):
+        if not entity_data:
+            return pd.DataFrame()
+
+        mentions = list(entity_data.values())
+        texts = np.array(list(map(itemgetter(0), entity_data)), dtype=object)
+        types = np.array(list(map(itemgetter(1), entity_data)), dtype=object)
+        frequencies = np.fromiter(map(len, mentions), dtype=np.int64, count=len(mentions))
+
+        # Deduplicate PMIDs per entity, dropping placeholders for invalid PMIDs
+        pmids = [np.unique(np.asarray(pmid_list, dtype=np.int64)) for pmid_list in mentions]
+        pmids = [pmid_array[pmid_array != INVALID_PMID] for pmid_array in pmids]
+
+        # Sort by frequency (descending); stable so ties keep first-seen order
+        order = np.argsort(-frequencies, kind='stable')
+
+        # Create entity IDs with type prefix
+        prefixes = np.where(types[order] == 'CHEMICAL', 'DRUG_', 'DISEASE_')
+        ranks = np.arange(1, len(order) + 1).astype(str)
+        entity_ids = np.char.add(prefixes, np.char.zfill(ranks, 4))
+
+        return pd.DataFrame({
+            'entity_id': entity_ids,
+            'entity_text': texts[order],
+            'entity_type': types[order],
+            'frequency': frequencies[order],
+            'source_pmids': [','.join(map(str, pmids[i])) for i in order],
+            'num_papers': [len(pmids[i]) for i in order]
+        })
+
+    def generate_statistics(self, df, num_abstracts):
         """Generate extraction statistics."""
         stats = {
             'extraction_date': datetime.now().isoformat(),
             'input': {
-                'total_abstracts': len(abstracts),
+                'total_abstracts': num_abstracts,
                 'source': 'PubMed abstracts (2020-2024)'
             },
             'output': {
@@ -186,6 +286,19 @@ def main():
     parser.add_argument('--stats', type=str,
                        default='data/processed/entity_extraction_stats.json',
                        help='Output JSON file for statistics')
+    parser.add_argument('--docbin', type=str,
+                       default='data/processed/abstracts.docbin',
+                       help='Output DocBin caching NER results for extract_relationships.py '
+                            '(empty string to disable)')
+    parser.add_argument('--model', type=str,
+                       default='en_ner_bc5cdr_md',
+                       help='spaCy NER model name or path to a trained pipeline directory '
+                            '(must predict CHEMICAL and DISEASE entities)')
+    parser.add_argument('--gpu', action='store_true',
+                       help='Run NER on GPU (requires spacy[cuda12x])')
+    parser.add_argument('--n-process', type=int,
+                       default=max(1, (os.cpu_count() or 1) - 1),
+                       help='Worker processes for nlp.pipe() (default: CPU count - 1; forced to 1 with --gpu)')
 
     args = parser.parse_args()
 
@@ -195,15 +308,23 @@ def main():
 
     # Load abstracts
     print(f"\n📖 Loading abstracts from {args.input}...")
-    with open(args.input, 'r') as f:
-        abstracts = json.load(f)
-    print(f"✅ Loaded {len(abstracts)} abstracts")
+    num_abstracts = count_abstracts(args.input)
+    abstracts = stream_abstracts(args.input)
+    print(f"✅ Found {num_abstracts} abstracts (streaming)")
 
     # Initialize extractor
-    extractor = EntityExtractor()
+    extractor = EntityExtractor(model_name=args.model, gpu=args.gpu,
+                                cache_docs=bool(args.docbin))
+    doc_bin = DocBin(attrs=DOCBIN_ATTRS) if args.docbin else None
 
     # Extract entities
-    entity_data = extractor.extract_from_abstracts(abstracts)
+    entity_data = extractor.extract_from_abstracts(
+        abstracts,
+        batch_size=256 if args.gpu else 32,
+        n_process=1 if args.gpu else args.n_process,
+        doc_bin=doc_bin,
+        num_abstracts=num_abstracts
+    )
 
     # Create DataFrame
     print(f"\n📊 Creating entity DataFrame...")
@@ -211,7 +332,7 @@ def main():
 
     # Generate statistics
     print(f"\n📈 Generating statistics...")
-    stats = extractor.generate_statistics(df, abstracts)
+    stats = extractor.generate_statistics(df, num_abstracts)
 
     # Save outputs
     print(f"\n💾 Saving outputs...")
@@ -228,6 +349,14 @@ def main():
         json.dump(stats, f, indent=2)
     print(f"✅ Statistics saved to {args.stats}")
 
+    # Save NER cache for the relationship extraction step
+    if doc_bin is not None:
+        Path(args.docbin).parent.mkdir(parents=True, exist_ok=True)
+        doc_bin.to_disk(args.docbin)
+        with open(docbin_meta_path(args.docbin), 'w') as f:
+            json.dump({'model': args.model, 'num_docs': len(doc_bin)}, f, indent=2)
+        print(f"✅ NER cache saved to {args.docbin} ({len(doc_bin)} docs)")
+
     # Print summary
     print("\n" + "=" * 70)
     print("📊 EXTRACTION SUMMARY")
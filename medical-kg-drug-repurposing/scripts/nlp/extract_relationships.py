@@ -5,10 +5,14 @@ Extract drug-disease relationships from PubMed abstracts using pattern matching
 
 Usage:
     python scripts/nlp/extract_relationships.py
+    python scripts/nlp/extract_relationships.py --gpu  # requires: pip install spacy[cuda12x]
+    python scripts/nlp/extract_relationships.py --model path/to/model  # any spaCy pipeline with CHEMICAL/DISEASE NER
+    python scripts/nlp/extract_relationships.py --whitelist-scan  # requires: pip install pyahocorasick
 
 Input:
     - data/raw/pubmed_abstracts.json (924 abstracts)
     - data/processed/entities.csv (1,514 entities)
+    - data/processed/abstracts.docbin (optional NER cache from extract_entities.py)
 
 Output:
     - data/processed/relationships.csv
@@ -16,27 +20,66 @@ Output:
 """
 
 import json
+import numpy as np
 import pandas as pd
 import spacy
+from spacy.attrs import ENT_TYPE, LOWER
 from spacy.matcher import Matcher
-from collections import defaultdict
+from spacy.pipeline import Sentencizer
+from spacy.tokens import DocBin
+from spacy.util import filter_spans
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 from tqdm import tqdm
 import argparse
+import itertools
+import os
 from datetime import datetime
 
+# Sibling script in scripts/nlp/ (on sys.path when run as a script)
+from extract_entities import count_abstracts, docbin_meta_path, stream_abstracts
+
+
+# The parser is kept for sentence boundaries (doc.sents). Patterns match on
+# LOWER forms instead of LEMMA, so the tagger/lemmatizer chain is not needed.
+UNUSED_COMPONENTS = ['tagger', 'attribute_ruler', 'lemmatizer']
+
+# Inflected forms used in place of LEMMA matches
+TREAT_FORMS = ["treat", "treats", "treated", "treating"]
+CURE_FORMS = ["cure", "cures", "cured", "curing"]
+PREVENT_FORMS = ["prevent", "prevents", "prevented", "preventing"]
+HELP_FORMS = ["help", "helps", "helped", "helping"]
+BE_FORMS = ["be", "is", "are", "was", "were", "been", "being"]
+REPURPOSE_FORMS = ["repurpose", "repurposes", "repurposed", "repurposing"]
+
 
 class RelationshipExtractor:
     """Extract drug-disease relationships from PubMed abstracts."""
 
-    def __init__(self):
-        """Initialize the BC5CDR NER model and spaCy Matcher for pattern matching."""
-        print("Loading BC5CDR model...")
-        self.nlp = spacy.load('en_ner_bc5cdr_md')
-        print("✅ Model loaded")
+    def __init__(self, model_name='en_ner_bc5cdr_md', gpu=False, whitelist_scan=False):
+        """
+        Initialize the BC5CDR NER model and spaCy Matcher for pattern matching.
+
+        Args:
+            model_name: spaCy model name or path to a trained pipeline directory
+            gpu: Run the model on GPU if one is available (requires spacy[cuda12x])
+            whitelist_scan: Without an NER cache, find known entities with an
+                Aho-Corasick scan instead of running NER (requires pyahocorasick)
+        """
+        self.model_name = model_name
+        self.whitelist_scan = whitelist_scan
+        self.automaton = None
+        if gpu:
+            print(f"GPU: {'enabled' if spacy.prefer_gpu() else 'not available, using CPU'}")
+
+        print(f"Loading {model_name} model...")
+        self.nlp = spacy.load(model_name, disable=UNUSED_COMPONENTS)
+        print(f"✅ Model loaded (active pipeline: {self.nlp.pipe_names})")
 
         # Initialize spaCy Matcher for pattern-based extraction
-        self.matcher = Matcher(self.nlp.vocab)
+        # (patterns are fixed and known-good, so skip schema validation)
+        self.matcher = Matcher(self.nlp.vocab, validate=False)
 
         # Define treatment patterns (much more readable than regex!)
         # Each pattern is a list of token specifications
@@ -45,7 +88,7 @@ class RelationshipExtractor:
             # Example: "Metformin treats diabetes"
             [
                 {"ENT_TYPE": "CHEMICAL"},
-                {"LEMMA": {"IN": ["treat", "cure", "prevent", "help"]}},
+                {"LOWER": {"IN": TREAT_FORMS + CURE_FORMS + PREVENT_FORMS + HELP_FORMS}},
                 {"ENT_TYPE": "DISEASE"}
             ],
 
@@ -74,7 +117,7 @@ class RelationshipExtractor:
             # Example: "Metformin is effective for diabetes"
             [
                 {"ENT_TYPE": "CHEMICAL"},
-                {"LEMMA": {"IN": ["be"]}},  # is/are/was/were
+                {"LOWER": {"IN": BE_FORMS}},  # is/are/was/were
                 {"LOWER": {"IN": ["used", "effective", "beneficial"]}},
                 {"LOWER": {"IN": ["for", "in", "against"]}},
                 {"ENT_TYPE": "DISEASE"}
@@ -85,7 +128,7 @@ class RelationshipExtractor:
             [
                 {"ENT_TYPE": "CHEMICAL"},
                 {"LOWER": {"IN": ["can", "may", "could", "might"]}},
-                {"LEMMA": {"IN": ["treat", "help", "cure", "prevent"]}},
+                {"LOWER": {"IN": TREAT_FORMS + HELP_FORMS + CURE_FORMS + PREVENT_FORMS}},
                 {"ENT_TYPE": "DISEASE"}
             ],
 
@@ -101,7 +144,7 @@ class RelationshipExtractor:
             # Pattern 7: "Repurposing drug for disease"
             # Example: "Repurposing ivermectin for COVID-19"
             [
-                {"LEMMA": "repurpose"},
+                {"LOWER": {"IN": REPURPOSE_FORMS}},
                 {"ENT_TYPE": "CHEMICAL"},
                 {"LOWER": {"IN": ["for", "against"]}},
                 {"ENT_TYPE": "DISEASE"}
@@ -111,7 +154,7 @@ class RelationshipExtractor:
             # Example: "Ivermectin repurposed for COVID-19"
             [
                 {"ENT_TYPE": "CHEMICAL"},
-                {"LEMMA": "repurpose"},
+                {"LOWER": {"IN": REPURPOSE_FORMS}},
                 {"LOWER": {"IN": ["for", "against"]}},
                 {"ENT_TYPE": "DISEASE"}
             ],
@@ -128,12 +171,22 @@ class RelationshipExtractor:
             # Example: "Diabetes treated with metformin"
             [
                 {"ENT_TYPE": "DISEASE"},
-                {"LEMMA": "treat"},
+                {"LOWER": {"IN": TREAT_FORMS}},
                 {"LOWER": {"IN": ["with", "using"]}},
                 {"ENT_TYPE": "CHEMICAL"}
             ],
         ]
 
+        # Intern every pattern string up-front so the Matcher compares
+        # uint64 hashes against the vocab instead of adding strings lazily
+        for pattern in treatment_patterns:
+            for token_spec in pattern:
+                for value in token_spec.values():
+                    values = value.get("IN", []) if isinstance(value, dict) else [value]
+                    for string in values:
+                        if isinstance(string, str):
+                            self.nlp.vocab.strings.add(string)
+
         # Add all patterns to matcher
         self.matcher.add("TREATMENT", treatment_patterns)
         print(f"✅ Loaded {len(treatment_patterns)} treatment patterns")
@@ -144,150 +197,297 @@ class RelationshipExtractor:
         df = pd.read_csv(entities_path)
 
         # Create sets for fast lookup (lowercase for matching)
-        self.drugs = set(df[df['entity_type'] == 'CHEMICAL']['entity_text'].str.lower())
-        self.diseases = set(df[df['entity_type'] == 'DISEASE']['entity_text'].str.lower())
+        self.drugs = frozenset(df[df['entity_type'] == 'CHEMICAL']['entity_text'].str.lower())
+        self.diseases = frozenset(df[df['entity_type'] == 'DISEASE']['entity_text'].str.lower())
+
+        # Same sets as StringStore hashes, so single tokens can be checked via
+        # token.lower (an int) without allocating a lowercased Python string
+        self.drug_hashes = frozenset(self.nlp.vocab.strings.add(text) for text in self.drugs)
+        self.disease_hashes = frozenset(self.nlp.vocab.strings.add(text) for text in self.diseases)
+        self.drug_hash_array = np.fromiter(self.drug_hashes, dtype=np.uint64, count=len(self.drug_hashes))
+        self.disease_hash_array = np.fromiter(self.disease_hashes, dtype=np.uint64, count=len(self.disease_hashes))
 
         # Create mapping from normalized text to entity_id
-        self.entity_to_id = {}
-        for _, row in df.iterrows():
-            normalized = row['entity_text'].lower()
-            self.entity_to_id[normalized] = {
-                'id': row['entity_id'],
-                'text': row['entity_text'],
-                'type': row['entity_type']
-            }
+        self.entity_to_id = {
+            normalized: {'id': entity_id, 'text': text, 'type': entity_type}
+            for normalized, entity_id, text, entity_type in zip(
+                df['entity_text'].str.lower(), df['entity_id'],
+                df['entity_text'], df['entity_type']
+            )
+        }
+
+        if self.whitelist_scan:
+            self.build_entity_automaton()
 
         print(f"✅ Loaded {len(self.drugs)} drugs and {len(self.diseases)} diseases")
 
-    def extract_entities_from_sentence(self, sentence):
-        """Extract drug and disease entities from a sentence using NER."""
-        doc = self.nlp(sentence)
+    def build_entity_automaton(self):
+        """Build an Aho-Corasick automaton over the known drug and disease names."""
+        import ahocorasick
 
-        drugs = []
-        diseases = []
+        self.automaton = ahocorasick.Automaton()
+        for name in self.diseases:
+            self.automaton.add_word(name, ('DISEASE', name))
+        # Names listed as both types resolve to CHEMICAL
+        for name in self.drugs:
+            self.automaton.add_word(name, ('CHEMICAL', name))
+        self.automaton.make_automaton()
+        self.sentencizer = Sentencizer()
 
-        for ent in doc.ents:
-            entity_text = ent.text.strip().lower()
+    def scan_entities(self, text):
+        """
+        Label known entities in text with the Aho-Corasick automaton instead of NER.
 
-            # Only keep if it's in our extracted entities
-            if ent.label_ == 'CHEMICAL' and entity_text in self.drugs:
-                drugs.append(entity_text)
-            elif ent.label_ == 'DISEASE' and entity_text in self.diseases:
-                diseases.append(entity_text)
+        Only matches that line up with token boundaries are kept, and
+        overlapping matches are resolved in favour of the longest.
 
-        return list(set(drugs)), list(set(diseases))
+        Args:
+            text: Abstract text
 
-    def pattern_based_extraction(self, text, pmid):
+        Returns:
+            Tokenized, sentence-split spaCy Doc with whitelist entities as doc.ents
         """
-        Extract relationships using spaCy Matcher pattern matching.
+        doc = self.nlp.make_doc(text)
+        spans = []
+        for end, (label, name) in self.automaton.iter(text.lower()):
+            span = doc.char_span(end - len(name) + 1, end + 1, label=label)
+            if span is not None:
+                spans.append(span)
+        doc.ents = filter_spans(spans)
+        return self.sentencizer(doc)
+
+    def entities_by_sentence(self, doc, sent_starts):
+        """
+        Bucket known drug and disease entities by sentence in a single pass.
+
+        Entity start offsets are located in the sentence-start array with
+        np.searchsorted instead of re-walking doc.ents for every sentence.
+
+        Args:
+            doc: NER-processed spaCy Doc
+            sent_starts: Token offsets of the sentence starts, in order
 
         Returns:
-            List of (drug, disease, evidence, confidence) tuples
+            Dictionary mapping sentence index -> (drugs, diseases) for sentences
+            with known entities
         """
-        relationships = []
+        # Only keep entities that are in our extracted entity lists
+        tagged = []
+        for ent in doc.ents:
+            # Span.text never carries trailing whitespace, so no strip() is needed
+            entity_text = ent.text.lower()
+            if ent.label_ == 'CHEMICAL' and entity_text in self.drugs:
+                tagged.append((ent.start, entity_text, 'CHEMICAL'))
+            elif ent.label_ == 'DISEASE' and entity_text in self.diseases:
+                tagged.append((ent.start, entity_text, 'DISEASE'))
 
-        # Process text with NER
-        doc = self.nlp(text)
+        if not tagged:
+            return {}
 
-        # Process each sentence separately for cleaner evidence extraction
-        for sent in doc.sents:
-            # Run matcher on sentence
-            sent_doc = self.nlp(sent.text)
-            matches = self.matcher(sent_doc)
-
-            # Extract relationships from matches
-            for match_id, start, end in matches:
-                matched_span = sent_doc[start:end]
-
-                # Extract drug and disease entities from the matched span
-                drug = None
-                disease = None
-
-                for token in matched_span:
-                    if token.ent_type_ == "CHEMICAL":
-                        drug_candidate = token.text.strip().lower()
-                        # Verify it's in our entity list
-                        if drug_candidate in self.drugs:
-                            drug = drug_candidate
-                    elif token.ent_type_ == "DISEASE":
-                        disease_candidate = token.text.strip().lower()
-                        # Verify it's in our entity list
-                        if disease_candidate in self.diseases:
-                            disease = disease_candidate
-
-                # Only add if both drug and disease found
-                if drug and disease:
-                    relationships.append({
-                        'drug': drug,
-                        'disease': disease,
-                        'evidence': sent.text.strip(),
-                        'pmid': pmid,
-                        'method': 'pattern',
-                        'confidence': 0.9  # High confidence for pattern matches
-                    })
+        ent_starts = np.fromiter((start for start, _, _ in tagged), dtype=np.int64, count=len(tagged))
+        sent_idx = np.searchsorted(sent_starts, ent_starts, side='right') - 1
 
-        return relationships
+        # Entities are in document order, so each sentence forms one contiguous group
+        buckets = {}
+        for idx, group in groupby(zip(sent_idx.tolist(), tagged), key=itemgetter(0)):
+            drugs, diseases = {}, {}
+            for _, (_, entity_text, label) in group:
+                (drugs if label == 'CHEMICAL' else diseases)[entity_text] = None
+            buckets[idx] = (list(drugs), list(diseases))
 
-    def cooccurrence_extraction(self, text, pmid):
+        return buckets
+
+    def candidate_pattern_sentences(self, doc, sent_starts):
         """
-        Extract relationships using co-occurrence in same sentence.
+        Flag the sentences the treatment patterns can produce a relationship in.
+
+        A pattern match only yields a relationship when the sentence has both a
+        whitelisted CHEMICAL token and a whitelisted DISEASE token, so the doc
+        is encoded as (ENT_TYPE, LOWER) hash arrays and screened with NumPy
+        before the Matcher runs.
+
+        Args:
+            doc: NER-processed spaCy Doc
+            sent_starts: Token offsets of the sentence starts, in order
 
         Returns:
-            List of (drug, disease, evidence, confidence) tuples
+            Boolean array marking the sentences worth running the Matcher on
+        """
+        tags = doc.to_array([ENT_TYPE, LOWER])
+        strings = self.nlp.vocab.strings
+        is_drug = (tags[:, 0] == strings['CHEMICAL']) & np.isin(tags[:, 1], self.drug_hash_array)
+        is_disease = (tags[:, 0] == strings['DISEASE']) & np.isin(tags[:, 1], self.disease_hash_array)
+
+        has_drug = np.zeros(len(sent_starts), dtype=bool)
+        has_disease = np.zeros(len(sent_starts), dtype=bool)
+        if is_drug.any() and is_disease.any():
+            token_sent = np.searchsorted(sent_starts, np.arange(len(doc)), side='right') - 1
+            has_drug[token_sent[is_drug]] = True
+            has_disease[token_sent[is_disease]] = True
+
+        return has_drug & has_disease
+
+    def extract_from_doc(self, doc, pmid):
         """
-        relationships = []
+        Extract relationships from a single NER-processed abstract.
 
-        # Process text in sentences
-        doc = self.nlp(text)
+        Pattern matching (spaCy Matcher) and sentence co-occurrence share one
+        walk over the sentences, reusing the same sentence spans and entity
+        buckets.
 
-        for sent in doc.sents:
-            sent_text = sent.text
+        Args:
+            doc: spaCy Doc for the combined title and abstract
+            pmid: PubMed ID
+
+        Returns:
+            List of relationship dictionaries, pattern matches first
+        """
+        sents = list(doc.sents)
+        if not sents:
+            return []
 
-            # Extract entities from sentence
-            drugs, diseases = self.extract_entities_from_sentence(sent_text)
+        sent_starts = np.fromiter((sent.start for sent in sents), dtype=np.int64, count=len(sents))
+        pattern_mask = self.candidate_pattern_sentences(doc, sent_starts)
+        buckets = self.entities_by_sentence(doc, sent_starts)
 
-            # Create relationships for all drug-disease pairs in sentence
+        pattern_rels = []
+        cooccurrence_rels = []
+
+        # Process each sentence separately for cleaner evidence extraction
+        for idx in sorted(buckets.keys() | set(np.flatnonzero(pattern_mask).tolist())):
+            sent = sents[idx]
+            evidence = sent.text.strip()
+
+            if pattern_mask[idx]:
+                # Run matcher on the sentence span
+                for matched_span in self.matcher(sent, as_spans=True):
+                    # Extract drug and disease entities from the matched span
+                    drug = None
+                    disease = None
+
+                    for token in matched_span:
+                        # Verify it's in our entity list (hash lookup on the lowercase form)
+                        if token.ent_type_ == "CHEMICAL":
+                            if token.lower in self.drug_hashes:
+                                drug = token.lower_
+                        elif token.ent_type_ == "DISEASE":
+                            if token.lower in self.disease_hashes:
+                                disease = token.lower_
+
+                    # Only add if both drug and disease found
+                    if drug and disease:
+                        pattern_rels.append({
+                            'drug': drug,
+                            'disease': disease,
+                            'evidence': evidence,
+                            'pmid': pmid,
+                            'method': 'pattern',
+                            'confidence': 0.9  # High confidence for pattern matches
+                        })
+
+            # Create co-occurrence relationships for all drug-disease pairs in sentence
+            drugs, diseases = buckets.get(idx, ((), ()))
             for drug in drugs:
                 for disease in diseases:
-                    relationships.append({
+                    cooccurrence_rels.append({
                         'drug': drug,
                         'disease': disease,
-                        'evidence': sent_text.strip(),
+                        'evidence': evidence,
                         'pmid': pmid,
                         'method': 'cooccurrence',
                         'confidence': 0.5  # Lower confidence for co-occurrence
                     })
 
-        return relationships
+        return pattern_rels + cooccurrence_rels
 
-    def extract_from_abstracts(self, abstracts):
+    def load_cached_docs(self, docbin_path, num_abstracts):
+        """
+        Load NER results cached by extract_entities.py.
+
+        Args:
+            docbin_path: Path to the DocBin written by extract_entities.py
+            num_abstracts: Number of abstracts the cache must line up with
+
+        Returns:
+            Iterator of Docs in abstract order, or None if the cache is missing,
+            was built by a different model or from a different abstract set
+        """
+        if not docbin_path or not Path(docbin_path).exists():
+            return None
+
+        meta_path = docbin_meta_path(docbin_path)
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        if meta.get('model') != self.model_name:
+            print(f"⚠️  NER cache {docbin_path} was built by model {meta.get('model', 'unknown')}, "
+                  f"not {self.model_name}, re-running NER")
+            return None
+
+        doc_bin = DocBin().from_disk(docbin_path)
+        if len(doc_bin) != num_abstracts:
+            print(f"⚠️  NER cache {docbin_path} has {len(doc_bin)} docs for "
+                  f"{num_abstracts} abstracts, re-running NER")
+            return None
+
+        print(f"✅ Using cached NER from {docbin_path}")
+        return doc_bin.get_docs(self.nlp.vocab)
+
+    def extract_from_abstracts(self, abstracts, batch_size=64, n_process=1, docbin_path=None,
+                               num_abstracts=None):
         """
         Extract all relationships from abstracts.
 
+        Each abstract is run through the NER model at most once (batched via
+        nlp.pipe), and not at all when a matching DocBin cache from
+        extract_entities.py is available; pattern matching and co-occurrence
+        then share a single sentence walk over that Doc.
+
         Args:
-            abstracts: List of abstract dictionaries
+            abstracts: List or stream of abstract dictionaries
+            batch_size: Number of abstracts per nlp.pipe() batch
+            n_process: Number of worker processes for nlp.pipe(). Values > 1
+                spawn workers on macOS/Windows, so callers must sit behind an
+                `if __name__ == '__main__':` guard
+            docbin_path: Optional DocBin cache of already-processed abstracts
+            num_abstracts: Abstract count for progress reporting (required
+                when abstracts is a stream rather than a list)
 
         Returns:
             List of relationship dictionaries
         """
-        print(f"\n🔬 Extracting relationships from {len(abstracts)} abstracts...")
+        if num_abstracts is None:
+            num_abstracts = len(abstracts)
+        print(f"\n🔬 Extracting relationships from {num_abstracts} abstracts...")
 
         all_relationships = []
 
-        for abstract in tqdm(abstracts, desc="Processing abstracts"):
-            pmid = abstract.get('pmid', 'unknown')
-            title = abstract.get('title', '')
-            abstract_text = abstract.get('abstract', '')
+        cached_docs = self.load_cached_docs(docbin_path, num_abstracts)
+
+        # Combine title and abstract (single pass, so abstracts may be a stream)
+        texts = (
+            (f"{abstract.get('title', '')}. {abstract.get('abstract', '')}", abstract.get('pmid', 'unknown'))
+            for abstract in abstracts
+        )
 
-            # Combine title and abstract
-            full_text = f"{title}. {abstract_text}"
+        def process(texts):
+            if self.automaton is not None:
+                print("🔎 Scanning for known entities with Aho-Corasick (NER skipped)")
+                return ((self.scan_entities(text), pmid) for text, pmid in texts)
+            return self.nlp.pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process)
 
-            # Extract using both methods
-            pattern_rels = self.pattern_based_extraction(full_text, pmid)
-            cooccur_rels = self.cooccurrence_extraction(full_text, pmid)
+        def pair_cached(cached_docs, texts):
+            # A cached Doc must reproduce its abstract's text; from the first
+            # mismatch on, the cache is stale and the rest is processed afresh
+            for doc, (text, pmid) in zip(cached_docs, texts):
+                if doc.text != text:
+                    print(f"\n⚠️  NER cache does not match abstract {pmid}, re-running NER from there")
+                    yield from process(itertools.chain([(text, pmid)], texts))
+                    return
+                yield doc, pmid
 
-            all_relationships.extend(pattern_rels)
-            all_relationships.extend(cooccur_rels)
+        docs = process(texts) if cached_docs is None else pair_cached(cached_docs, texts)
+
+        for doc, pmid in tqdm(docs, total=num_abstracts, desc="Processing abstracts"):
+            all_relationships.extend(self.extract_from_doc(doc, pmid))
 
         return all_relationships
 
@@ -303,58 +503,52 @@ class RelationshipExtractor:
         """
         print("\n🔄 Deduplicating and aggregating relationships...")
 
-        # Group by (drug, disease)
-        grouped = defaultdict(lambda: {
-            'pmids': set(),
-            'evidences': [],
-            'methods': set(),
-            'max_confidence': 0.0
-        })
+        raw = pd.DataFrame(relationships, columns=['drug', 'disease', 'evidence', 'pmid', 'method', 'confidence'])
 
-        for rel in relationships:
-            key = (rel['drug'], rel['disease'])
-            grouped[key]['pmids'].add(rel['pmid'])
-            grouped[key]['evidences'].append(rel['evidence'])
-            grouped[key]['methods'].add(rel['method'])
-            grouped[key]['max_confidence'] = max(
-                grouped[key]['max_confidence'],
-                rel['confidence']
-            )
+        # Group by (drug, disease), aggregating in pandas instead of a Python loop
+        keys = ['drug', 'disease']
+        agg = raw.groupby(keys, sort=True).agg(
+            max_confidence=('confidence', 'max')
+        ).reset_index()
+
+        # Distinct extraction methods per pair, sorted once for the whole table
+        # rather than through a set/sorted lambda per group
+        pair_methods = raw[keys + ['method']].drop_duplicates().sort_values(keys + ['method'])
+        agg['methods'] = pair_methods.groupby(keys, sort=True)['method'].agg(','.join).to_numpy()
+
+        # Shortest (most informative) evidence per pair, picked with one
+        # vectorized idxmin over evidence lengths instead of min() per group
+        shortest = raw['evidence'].str.len().groupby([raw[key] for key in keys], sort=True).idxmin()
+        agg['best_evidence'] = raw['evidence'].to_numpy()[shortest.to_numpy()]
+
+        # Unique PMIDs per pair, sorted once for the whole table; only the
+        # first 10 per pair are joined into the evidence string
+        pair_pmids = raw[keys + ['pmid']].drop_duplicates().sort_values(keys + ['pmid'])
+        num_papers = pair_pmids.groupby(keys, sort=True).size().to_numpy()
+        evidence_pmids = (pair_pmids.groupby(keys, sort=True).head(10)
+                          .groupby(keys, sort=True)['pmid'].agg(','.join).to_numpy())
+
+        # Boost confidence if multiple papers mention the relationship
+        boost = np.where(num_papers >= 3, 0.1, np.where(num_papers >= 2, 0.05, 0.0))
+        confidence = np.minimum(1.0, agg['max_confidence'].to_numpy() + boost)
+
+        # Relationship IDs formatted in one vectorized pass after aggregation
+        relationship_ids = np.char.mod('REL_%05d', np.arange(1, len(agg) + 1))
 
         # Create DataFrame
-        rows = []
-        for idx, ((drug, disease), data) in enumerate(sorted(grouped.items()), 1):
-            # Get entity IDs
-            drug_id = self.entity_to_id.get(drug, {}).get('id', 'UNKNOWN')
-            disease_id = self.entity_to_id.get(disease, {}).get('id', 'UNKNOWN')
-
-            # Select best evidence (shortest, most informative)
-            evidences = sorted(data['evidences'], key=len)
-            best_evidence = evidences[0] if evidences else ""
-
-            # Boost confidence if multiple papers mention the relationship
-            num_papers = len(data['pmids'])
-            confidence = data['max_confidence']
-            if num_papers >= 3:
-                confidence = min(1.0, confidence + 0.1)
-            elif num_papers >= 2:
-                confidence = min(1.0, confidence + 0.05)
-
-            rows.append({
-                'relationship_id': f'REL_{idx:05d}',
-                'drug_id': drug_id,
-                'drug_text': drug,
-                'disease_id': disease_id,
-                'disease_text': disease,
-                'relationship_type': 'TREATS',
-                'confidence': round(confidence, 2),
-                'evidence_text': best_evidence[:500],  # Limit length
-                'evidence_pmids': ','.join(sorted(data['pmids'])[:10]),  # Limit to 10 PMIDs
-                'num_papers': num_papers,
-                'extraction_methods': ','.join(sorted(data['methods']))
-            })
-
-        df = pd.DataFrame(rows)
+        df = pd.DataFrame({
+            'relationship_id': relationship_ids,
+            'drug_id': [self.entity_to_id.get(drug, {}).get('id', 'UNKNOWN') for drug in agg['drug']],
+            'drug_text': agg['drug'],
+            'disease_id': [self.entity_to_id.get(disease, {}).get('id', 'UNKNOWN') for disease in agg['disease']],
+            'disease_text': agg['disease'],
+            'relationship_type': 'TREATS',
+            'confidence': np.round(confidence, 2),
+            'evidence_text': agg['best_evidence'].str[:500],  # Limit length
+            'evidence_pmids': evidence_pmids,  # Limit to 10 PMIDs
+            'num_papers': num_papers,
+            'extraction_methods': agg['methods']
+        })
 
         # Sort by confidence and num_papers
         df = df.sort_values(['confidence', 'num_papers'],
@@ -398,12 +592,27 @@ def main():
     parser.add_argument('--entities', type=str,
                        default='data/processed/entities.csv',
                        help='Input CSV file with entities')
+    parser.add_argument('--docbin', type=str,
+                       default='data/processed/abstracts.docbin',
+                       help='NER cache written by extract_entities.py (re-runs NER if missing)')
     parser.add_argument('--output', type=str,
                        default='data/processed/relationships.csv',
                        help='Output CSV file for relationships')
     parser.add_argument('--stats', type=str,
                        default='data/processed/relationship_extraction_stats.json',
                        help='Output JSON file for statistics')
+    parser.add_argument('--whitelist-scan', action='store_true',
+                       help='Without an NER cache, find known entities with an '
+                            'Aho-Corasick scan instead of NER (requires pyahocorasick)')
+    parser.add_argument('--model', type=str,
+                       default='en_ner_bc5cdr_md',
+                       help='spaCy NER model name or path to a trained pipeline directory '
+                            '(must predict CHEMICAL and DISEASE entities)')
+    parser.add_argument('--gpu', action='store_true',
+                       help='Run NER on GPU (requires spacy[cuda12x])')
+    parser.add_argument('--n-process', type=int,
+                       default=max(1, (os.cpu_count() or 1) - 1),
+                       help='Worker processes for nlp.pipe() (default: CPU count - 1; forced to 1 with --gpu)')
 
     args = parser.parse_args()
 
@@ -413,18 +622,25 @@ def main():
 
     # Load abstracts
     print(f"\n📖 Loading abstracts from {args.abstracts}...")
-    with open(args.abstracts, 'r') as f:
-        abstracts = json.load(f)
-    print(f"✅ Loaded {len(abstracts)} abstracts")
+    num_abstracts = count_abstracts(args.abstracts)
+    abstracts = stream_abstracts(args.abstracts)
+    print(f"✅ Found {num_abstracts} abstracts (streaming)")
 
     # Initialize extractor
-    extractor = RelationshipExtractor()
+    extractor = RelationshipExtractor(model_name=args.model, gpu=args.gpu,
+                                      whitelist_scan=args.whitelist_scan)
 
     # Load entities
     extractor.load_entities(args.entities)
 
     # Extract relationships
-    raw_relationships = extractor.extract_from_abstracts(abstracts)
+    raw_relationships = extractor.extract_from_abstracts(
+        abstracts,
+        batch_size=256 if args.gpu else 32,
+        n_process=1 if args.gpu else args.n_process,
+        docbin_path=args.docbin,
+        num_abstracts=num_abstracts
+    )
     print(f"\n✅ Extracted {len(raw_relationships)} raw relationship mentions")
 
     # Deduplicate and aggregate
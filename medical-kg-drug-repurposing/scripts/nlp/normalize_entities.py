@@ -17,156 +17,220 @@ Output:
     - data/processed/normalization_report.json (statistics)
 """
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import json
+import unicodedata
 from pathlib import Path
 from collections import defaultdict
 import argparse
 
 
+# PubChem columns carried through to normalized drug entities
+PUBCHEM_INFO_COLUMNS = ['molecular_formula', 'molecular_weight', 'canonical_smiles',
+                        'iupac_name', 'synonyms']
+
+
+def lnrm(text):
+    """
+    Lower-cased normalized form of a name: diacritics folded (NFKD), then
+    everything except letters and digits dropped.
+
+    "Aspirin", "aspirin " and "aspirin." all map to "aspirin".
+    """
+    return ''.join(ch for ch in unicodedata.normalize('NFKD', text).lower() if ch.isalnum())
+
+
+def lower_names(values):
+    """
+    Lowercase many names at once.
+
+    ASCII names (nearly all drug names) go through Arrow's ascii_lower
+    kernel, which skips Unicode case tables; the rare non-ASCII name falls
+    back to str.lower() so results match it exactly.
+
+    Args:
+        values: Sequence of strings (missing values stay missing)
+
+    Returns:
+        numpy object array of lowercased names
+    """
+    arr = pa.array(values, type=pa.string())
+    lowered = pc.ascii_lower(arr).to_numpy(zero_copy_only=False)
+    is_ascii = pc.fill_null(pc.string_is_ascii(arr), True).to_numpy(zero_copy_only=False)
+    for i in np.flatnonzero(~is_ascii):
+        lowered[i] = arr[int(i)].as_py().lower()
+    return lowered
+
+
 def load_pubchem_data(pubchem_file):
     """
     Load PubChem drugs and create synonym mappings.
 
     Returns:
-        dict: Mapping from drug name/synonym -> PubChem record
+        tuple: (key_to_row, pubchem_columns) where key_to_row maps each lowercase
+        drug name/synonym to a PubChem row index, and pubchem_columns maps
+        'canonical_name', 'cid' and PUBCHEM_INFO_COLUMNS to arrays indexed
+        by that row
     """
     print(f"📥 Loading PubChem data from {pubchem_file}...")
 
-    df = pd.read_csv(pubchem_file)
+    # Only parse the columns used below (descriptions/InChI are skipped);
+    # the pyarrow engine parses the CSV on multiple threads
+    header = pd.read_csv(pubchem_file, nrows=0).columns
+    usecols = [col for col in ['cid', 'name', *PUBCHEM_INFO_COLUMNS] if col in header]
+    df = pd.read_csv(pubchem_file, engine='pyarrow', usecols=usecols)
     print(f"   Loaded {len(df)} PubChem drugs")
 
-    # Create synonym mapping
-    drug_mapping = {}
-
-    for _, row in df.iterrows():
-        canonical_name = row['name'].lower()
-        cid = row['cid']
-
-        # Add canonical name
-        drug_mapping[canonical_name] = {
-            'canonical_name': row['name'],
-            'cid': cid,
-            'molecular_formula': row.get('molecular_formula', ''),
-            'molecular_weight': row.get('molecular_weight', ''),
-            'canonical_smiles': row.get('canonical_smiles', ''),
-            'iupac_name': row.get('iupac_name', ''),
-            'synonyms': row.get('synonyms', '')
-        }
-
-        # Add synonyms
-        if pd.notna(row.get('synonyms')):
-            synonyms = str(row['synonyms']).split('|')
-            for syn in synonyms[:20]:  # First 20 synonyms
-                syn_lower = syn.strip().lower()
-                if syn_lower and syn_lower not in drug_mapping:
-                    drug_mapping[syn_lower] = drug_mapping[canonical_name]
-
-    print(f"   Created mapping with {len(drug_mapping)} drug names/synonyms")
-    return drug_mapping
-
-
-def normalize_entities(entities_df, drug_mapping):
+    # One array per PubChem field; names and synonyms only store a row index
+    pubchem_columns = {
+        'canonical_name': df['name'].to_numpy(),
+        'cid': df['cid'].to_numpy(),
+        **{col: df[col].to_numpy() if col in df else np.full(len(df), '', dtype=object)
+           for col in PUBCHEM_INFO_COLUMNS}
+    }
+
+    # Add canonical names (a repeated name maps to its last record)
+    names_lower = lower_names(df['name'].astype(str))
+    key_to_row = dict(zip(names_lower, range(len(df))))
+
+    # Add synonyms: first 20 per drug, split/stripped/lowercased in pandas
+    synonyms = df.get('synonyms', pd.Series(dtype=object)).dropna().astype(str).str.split('|').str[:20].explode()
+    synonyms = pd.Series(lower_names(synonyms.str.strip()), index=synonyms.index)
+    synonyms = synonyms[(synonyms.str.len() > 0) & ~synonyms.duplicated(keep='first')]
+
+    # Canonical names take precedence; otherwise the first drug listing a synonym wins
+    for syn, row_idx in zip(synonyms, synonyms.index):
+        key_to_row.setdefault(syn, row_idx)
+
+    print(f"   Created mapping with {len(key_to_row)} drug names/synonyms")
+    return key_to_row, pubchem_columns
+
+
+def build_lnrm_index(key_to_row):
+    """
+    Index the PubChem mapping by LNRM key, for names that miss the exact
+    lowercase lookup.
+
+    Returns:
+        dict: Mapping from LNRM key -> key_to_row key (canonical names win,
+        since they are inserted before synonyms)
+    """
+    lnrm_index = {}
+    for name in key_to_row:
+        key = lnrm(name)
+        if key:
+            lnrm_index.setdefault(key, name)
+    return lnrm_index
+
+
+def normalize_entities(entities_df, key_to_row, pubchem_columns, lnrm_index=None):
     """
     Normalize drug entities using PubChem mapping.
 
     Args:
         entities_df: DataFrame with extracted entities
-        drug_mapping: PubChem synonym mapping
+        key_to_row: PubChem name/synonym -> row index (from load_pubchem_data)
+        pubchem_columns: PubChem field arrays indexed by row (from load_pubchem_data)
+        lnrm_index: LNRM fallback index from build_lnrm_index (built from
+            key_to_row if not given)
 
     Returns:
         DataFrame: Normalized entities with PubChem info
     """
+    if lnrm_index is None:
+        lnrm_index = build_lnrm_index(key_to_row)
+
     print(f"\n🔄 Normalizing entities...")
 
     # Separate drugs and diseases
     drugs = entities_df[entities_df['entity_type'] == 'CHEMICAL'].copy()
-    diseases = entities_df[entities_df['entity_type'] == 'DISEASE'].copy()
+    diseases = entities_df[entities_df['entity_type'] == 'DISEASE']
 
     print(f"   Original: {len(drugs)} drugs, {len(diseases)} diseases")
 
-    # Normalize drug names
-    normalized_drugs = []
-    matched_count = 0
-    unmatched_drugs = []
-
-    for _, drug in drugs.iterrows():
-        drug_name_lower = drug['entity_text'].lower()
-
-        if drug_name_lower in drug_mapping:
-            # Matched to PubChem!
-            pubchem_info = drug_mapping[drug_name_lower]
-            matched_count += 1
-
-            normalized_drugs.append({
-                'entity_id': drug['entity_id'],
-                'entity_text': pubchem_info['canonical_name'],  # Use canonical name
-                'entity_type': 'CHEMICAL',
-                'frequency': drug['frequency'],
-                'num_papers': drug['num_papers'],
-                # Add PubChem info
-                'pubchem_cid': pubchem_info['cid'],
-                'molecular_formula': pubchem_info['molecular_formula'],
-                'molecular_weight': pubchem_info['molecular_weight'],
-                'canonical_smiles': pubchem_info['canonical_smiles'],
-                'iupac_name': pubchem_info['iupac_name'],
-                'validated': True
-            })
-        else:
-            # Not found in PubChem
-            unmatched_drugs.append(drug['entity_text'])
-
-            # Keep but mark as unvalidated
-            normalized_drugs.append({
-                'entity_id': drug['entity_id'],
-                'entity_text': drug['entity_text'],
-                'entity_type': 'CHEMICAL',
-                'frequency': drug['frequency'],
-                'num_papers': drug['num_papers'],
-                'pubchem_cid': None,
-                'molecular_formula': None,
-                'molecular_weight': None,
-                'canonical_smiles': None,
-                'iupac_name': None,
-                'validated': False
-            })
-
-    # Convert to DataFrame
-    drugs_normalized = pd.DataFrame(normalized_drugs)
+    # Lowercase lookup keys in one vectorized pass
+    drugs['_key'] = pd.Series(lower_names(drugs['entity_text']), index=drugs.index, dtype=object)
+
+    # Exact lowercase hits first; only misses fall back to their LNRM key
+    keys = pd.Index(list(key_to_row))
+    missing = ~drugs['_key'].isin(keys)
+    drugs.loc[missing, '_key'] = drugs.loc[missing, '_key'].map(lnrm).map(lnrm_index)
+    lnrm_count = int(drugs.loc[missing, '_key'].notna().sum())
+
+    # Normalize drug names: encode lookup keys as integer codes into the
+    # mapping (-1 = no match), turn codes into PubChem rows, then gather
+    # PubChem columns by row
+    codes = pd.Categorical(drugs['_key'], categories=keys).codes
+    validated = codes >= 0
+    matched_count = int(validated.sum())
+    unmatched_drugs = drugs.loc[~validated, 'entity_text'].tolist()
+    # A trailing -1 lets code -1 index straight to "no row"
+    key_rows = np.append(np.fromiter(key_to_row.values(), dtype=np.int64, count=len(key_to_row)), -1)
+    rows = key_rows[codes]
+
+    def gather(col):
+        return pd.api.extensions.take(pubchem_columns[col], rows, allow_fill=True)
+
+    # Matched drugs take the PubChem canonical name; unmatched ones are kept
+    # but marked as unvalidated
+    drugs_normalized = pd.DataFrame({
+        'entity_id': drugs['entity_id'].to_numpy(),
+        'entity_text': np.where(validated, gather('canonical_name'), drugs['entity_text'].to_numpy()),
+        'entity_type': 'CHEMICAL',
+        'frequency': drugs['frequency'].to_numpy(),
+        'num_papers': drugs['num_papers'].to_numpy(),
+        # Add PubChem info
+        'pubchem_cid': gather('cid'),
+        'molecular_formula': gather('molecular_formula'),
+        'molecular_weight': gather('molecular_weight'),
+        'canonical_smiles': gather('canonical_smiles'),
+        'iupac_name': gather('iupac_name'),
+        'validated': validated
+    })
 
     # Merge duplicates (same canonical name)
     print(f"\n   Merging duplicate drug names...")
-    drugs_merged = drugs_normalized.groupby('entity_text').agg({
-        'entity_id': 'first',
-        'entity_type': 'first',
-        'frequency': 'sum',  # Sum frequencies
-        'num_papers': 'sum',  # Sum paper counts
-        'pubchem_cid': 'first',
-        'molecular_formula': 'first',
-        'molecular_weight': 'first',
-        'canonical_smiles': 'first',
-        'iupac_name': 'first',
-        'validated': 'first'
-    }).reset_index()
-
-    # Add diseases (unchanged)
-    diseases_normalized = diseases.copy()
-    diseases_normalized['pubchem_cid'] = None
-    diseases_normalized['molecular_formula'] = None
-    diseases_normalized['molecular_weight'] = None
-    diseases_normalized['canonical_smiles'] = None
-    diseases_normalized['iupac_name'] = None
-    diseases_normalized['validated'] = True  # Diseases are always valid
+    # Sum frequencies and paper counts; every other column comes from the
+    # first row with that name. One Arrow hash aggregation in a single thread
+    # keeps groups in first-appearance order; nulls are not skipped so
+    # "first" really is the first row.
+    first = pc.ScalarAggregateOptions(skip_nulls=False)
+    merged_columns = ['entity_text', 'entity_id', 'entity_type', 'frequency', 'num_papers', 'pubchem_cid',
+                      'molecular_formula', 'molecular_weight', 'canonical_smiles', 'iupac_name', 'validated']
+    aggregations = [(col, 'sum') if col in ('frequency', 'num_papers') else (col, 'first', first)
+                    for col in merged_columns[1:]]
+    # Group on dictionary-encoded names so the hash table works on integer codes
+    drugs_normalized['entity_text'] = drugs_normalized['entity_text'].astype('category')
+    table = pa.Table.from_pandas(drugs_normalized, preserve_index=False)
+    del drugs_normalized
+    # All-missing object columns arrive as the null type, which has no "first" kernel
+    table = table.cast(pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                                  for field in table.schema]))
+    grouped = table.group_by('entity_text', use_threads=False).aggregate(aggregations)
+    drugs_merged = grouped.select(['entity_text'] + [f'{col}_{func}' for col, func, *_ in aggregations]) \
+        .rename_columns(merged_columns).to_pandas(self_destruct=True)
+    del table, grouped
+    drugs_merged['entity_text'] = drugs_merged['entity_text'].astype(str)
+
+    # Add diseases (unchanged); diseases are always valid
+    diseases_normalized = diseases.assign(
+        pubchem_cid=None, molecular_formula=None, molecular_weight=None,
+        canonical_smiles=None, iupac_name=None, validated=True
+    )
 
     # Combine
-    all_entities = pd.concat([drugs_merged, diseases_normalized], ignore_index=True)
+    all_entities = pd.concat([drugs_merged, diseases_normalized], ignore_index=True, sort=False)
 
     # Statistics
     validated_drugs = drugs_merged[drugs_merged['validated'] == True]
     unvalidated_drugs = drugs_merged[drugs_merged['validated'] == False]
 
     print(f"\n✅ Normalization complete:")
-    print(f"   • Drugs matched to PubChem: {len(validated_drugs)} ({matched_count} original)")
+    print(f"   • Drugs matched to PubChem: {len(validated_drugs)} ({matched_count} original, {lnrm_count} via LNRM)")
     print(f"   • Drugs NOT in PubChem: {len(unvalidated_drugs)}")
     print(f"   • Diseases: {len(diseases)}")
     print(f"   • Total entities: {len(all_entities)}")
@@ -183,6 +247,7 @@ def normalize_entities(entities_df, drug_mapping):
         'diseases': len(diseases),
         'drugs_merged': len(drugs) - len(drugs_merged),
         'matched_to_pubchem': matched_count,
+        'matched_via_lnrm': lnrm_count,
         'unmatched_drugs_sample': unmatched_drugs[:20]
     }
 
@@ -222,18 +287,24 @@ def main():
         return
 
     # Load data
-    entities_df = pd.read_csv(entities_file)
+    entities_df = pd.read_csv(entities_file, engine='pyarrow')
     print(f"📥 Loaded {len(entities_df)} entities from {entities_file}")
 
-    drug_mapping = load_pubchem_data(pubchem_file)
+    key_to_row, pubchem_columns = load_pubchem_data(pubchem_file)
+    lnrm_index = build_lnrm_index(key_to_row)
 
     # Normalize
-    normalized_entities, report = normalize_entities(entities_df, drug_mapping)
+    normalized_entities, report = normalize_entities(entities_df, key_to_row, pubchem_columns, lnrm_index)
 
     # Save normalized entities
     output_file = Path(args.output)
     output_file.parent.mkdir(parents=True, exist_ok=True)
-    normalized_entities.to_csv(output_file, index=False)
+    # Arrow's CSV writer is multi-threaded. pyarrow is a hard requirement, so the
+    # pandas fallback only covers columns Arrow cannot convert (e.g. mixed types)
+    try:
+        pacsv.write_csv(pa.Table.from_pandas(normalized_entities, preserve_index=False), str(output_file))
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        normalized_entities.to_csv(output_file, index=False)
     print(f"\n💾 Saved normalized entities to: {output_file}")
 
     # Save report
@@ -5,150 +5,351 @@ Validate GNN predictions against PubMed literature.
 
 Usage:
     python scripts/validation/validate_predictions.py --top-k 100
+    python scripts/validation/validate_predictions.py --top-k 100 --api-key YOUR_NCBI_KEY
+    python scripts/validation/validate_predictions.py --top-k 100 --no-cache
 """
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import hashlib
 import json
+import re
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import argparse
 from Bio import Entrez
 from collections import defaultdict
+from diskcache import Cache
 import sys
 
 # Set email for NCBI (required by PubMed API)
 Entrez.email = "student@example.com"
 
+# NCBI E-utilities request limits (requests per second)
+NCBI_RATE_LIMIT = 3
+NCBI_RATE_LIMIT_WITH_KEY = 10
+
+# Diseases OR-ed into one drug-level PubMed query
+MAX_DISEASES_PER_QUERY = 50
+
+# PubMed responses are cached on disk so unchanged re-runs skip the network
+PUBMED_CACHE_DIR = '.pubmed_cache'
+CACHE_EXPIRE_SECONDS = 30 * 24 * 60 * 60  # 30 days
+
+# MEDLINE fields: a title runs until the next tag line (continuations are indented)
+PMID_RE = re.compile(r'^PMID- (\S+)', re.M)
+TITLE_RE = re.compile(r'^TI  - (.+?)(?=\n[A-Z]{2,4} *- |\Z)', re.M | re.S)
+
+
+def pair_query(drug, disease):
+    """Build the PubMed query for articles mentioning both drug and disease."""
+    return f'("{drug}"[Title/Abstract]) AND ("{disease}"[Title/Abstract])'
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces requests at least `interval` seconds apart."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller's request slot comes up."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 
 class PredictionValidator:
     """Validate drug-disease predictions against PubMed literature."""
 
-    def __init__(self, predictions_path='data/results/novel_predictions.csv'):
+    def __init__(self, predictions_path='data/results/novel_predictions.csv', api_key=None,
+                 cache_dir=PUBMED_CACHE_DIR):
         print(f"\n📖 Loading predictions from {predictions_path}...")
         self.predictions_df = pd.read_csv(predictions_path)
         print(f"   ✅ Loaded {len(self.predictions_df)} predictions")
 
-    def search_pubmed(self, drug, disease, max_results=100):
+        # An NCBI API key raises the allowed request rate from 3/s to 10/s
+        if api_key:
+            Entrez.api_key = api_key
+        self.requests_per_second = NCBI_RATE_LIMIT_WITH_KEY if api_key else NCBI_RATE_LIMIT
+        self.rate_limiter = RateLimiter(1.0 / self.requests_per_second)
+
+        # Disk cache of PubMed responses (None disables caching)
+        self.cache = Cache(cache_dir) if cache_dir else None
+
+    def cache_get(self, key):
+        """Look up a cached PubMed response by query/key string."""
+        if self.cache is None:
+            return None
+        return self.cache.get(hashlib.sha1(key.encode()).hexdigest())
+
+    def cache_set(self, key, value):
+        """Store a PubMed response for CACHE_EXPIRE_SECONDS."""
+        if self.cache is not None:
+            self.cache.set(hashlib.sha1(key.encode()).hexdigest(), value, expire=CACHE_EXPIRE_SECONDS)
+
+    def search_drug(self, drug, diseases):
+        """
+        Search PubMed once for a drug together with any of several diseases.
+
+        The result set is kept on the NCBI history server so per-disease
+        searches can refine it instead of re-running the drug query.
+
+        Args:
+            drug: Drug name
+            diseases: Disease names to OR together
+
+        Returns:
+            dict with the combined count and the WebEnv/query_key of the
+            stored result set (count only when served from the cache), or
+            None if the search failed
+        """
+        disease_terms = ' OR '.join(f'"{disease}"[Title/Abstract]' for disease in diseases)
+        query = f'("{drug}"[Title/Abstract]) AND ({disease_terms})'
+
+        cached_count = self.cache_get(query)
+        if cached_count is not None:
+            return {'count': cached_count}
+
+        try:
+            self.rate_limiter.wait()
+            handle = Entrez.esearch(db="pubmed", term=query, retmax=0, usehistory='y')
+            record = Entrez.read(handle)
+            handle.close()
+
+            count = int(record["Count"])
+            self.cache_set(query, count)
+            return {
+                'count': count,
+                'webenv': record["WebEnv"],
+                'query_key': record["QueryKey"]
+            }
+
+        except Exception as e:
+            print(f"   ⚠️  Error searching for '{drug}' + {len(diseases)} diseases: {e}")
+            return None
+
+    def search_pubmed(self, drug, disease, max_results=5, history=None):
         """
         Search PubMed for articles mentioning both drug and disease.
 
         Args:
             drug: Drug name
             disease: Disease name
-            max_results: Maximum articles to retrieve
+            max_results: Maximum PMIDs to retrieve (only these are kept, so
+                the response carries no more IDs than needed)
+            history: Optional result of search_drug() to refine instead of
+                searching for the drug again
 
         Returns:
-            dict with count and article titles
+            dict with count and the PMIDs of up to max_results articles
+            (titles are fetched for all pairs at once by fetch_titles)
         """
+        # Results are cached under the plain pair query, however they were fetched
+        cache_key = pair_query(drug, disease)
+        cached = self.cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         # Create search query
-        query = f'("{drug}"[Title/Abstract]) AND ("{disease}"[Title/Abstract])'
+        if history is None or 'webenv' not in history:
+            query = cache_key
+            history_params = {}
+        else:
+            query = f'#{history["query_key"]} AND ("{disease}"[Title/Abstract])'
+            history_params = {'WebEnv': history['webenv'], 'usehistory': 'y'}
 
         try:
             # Search PubMed
-            handle = Entrez.esearch(db="pubmed", term=query, retmax=max_results)
+            self.rate_limiter.wait()
+            handle = Entrez.esearch(db="pubmed", term=query, retmax=max_results, **history_params)
             record = Entrez.read(handle)
             handle.close()
 
-            count = int(record["Count"])
-            id_list = record["IdList"]
+            result = {
+                'count': int(record["Count"]),
+                'pmids': list(record["IdList"])
+            }
+            self.cache_set(cache_key, result)
+            return result
 
-            # Fetch article titles if there are results
-            titles = []
-            if id_list:
-                # Fetch details for up to 5 articles
-                fetch_handle = Entrez.efetch(db="pubmed", id=id_list[:5], rettype="medline", retmode="text")
-                articles = fetch_handle.read()
-                fetch_handle.close()
+        except Exception as e:
+            print(f"   ⚠️  Error searching for '{drug}' + '{disease}': {e}")
+            return {'count': 0, 'pmids': []}
 
-                # Simple title extraction
-                for line in articles.split('\n'):
-                    if line.startswith('TI  - '):
-                        titles.append(line[6:].strip())
+    def fetch_titles(self, pmids):
+        """
+        Fetch article titles for many PMIDs with a single efetch request.
 
-            return {
-                'count': count,
-                'titles': titles[:5]  # Top 5 titles
-            }
+        Args:
+            pmids: PubMed IDs collected from all searches
+
+        Returns:
+            dict mapping PMID -> title
+        """
+        titles = {}
+        missing = []
+        for pmid in dict.fromkeys(pmids):
+            title = self.cache_get(f'title:{pmid}')
+            if title is None:
+                missing.append(pmid)
+            else:
+                titles[pmid] = title
+
+        if not missing:
+            return titles
 
+        try:
+            self.rate_limiter.wait()
+            fetch_handle = Entrez.efetch(db="pubmed", id=','.join(missing), rettype="medline", retmode="text")
+            articles = fetch_handle.read()
+            fetch_handle.close()
         except Exception as e:
-            print(f"   ⚠️  Error searching for '{drug}' + '{disease}': {e}")
-            return {'count': 0, 'titles': []}
+            print(f"   ⚠️  Error fetching titles for {len(missing)} articles: {e}")
+            return titles
 
-    def classify_prediction(self, count):
+        # Records are separated by blank lines; multi-line titles are joined
+        for record in articles.split('\n\n'):
+            pmid = PMID_RE.search(record)
+            title = TITLE_RE.search(record)
+            if pmid and title:
+                titles[pmid.group(1)] = ' '.join(title.group(1).split())
+                self.cache_set(f'title:{pmid.group(1)}', titles[pmid.group(1)])
+
+        return titles
+
+    def classify_predictions(self, counts):
         """
-        Classify prediction based on literature support.
+        Classify predictions based on literature support.
 
         Categories:
         - Confirmed: Strong evidence (≥5 papers)
         - Emerging: Some evidence (1-4 papers)
         - Novel: No direct evidence (0 papers) - highest value!
         - Uncertain: Reserved for manual review
+
+        Args:
+            counts: Array of PubMed paper counts, one per prediction
+
+        Returns:
+            Array of validation statuses
         """
-        if count >= 5:
-            return 'Confirmed'
-        elif count >= 1:
-            return 'Emerging'
-        else:
-            return 'Novel'
+        return np.select([counts >= 5, counts >= 1], ['Confirmed', 'Emerging'], default='Novel')
 
-    def validate_predictions(self, top_k=100, rate_limit_delay=0.5):
+    def validate_predictions(self, top_k=100, rate_limit_delay=None):
         """
         Validate top-K predictions against PubMed.
 
+        Diseases are grouped per drug into one OR-ed search, and pairs are
+        only searched individually when their drug group has any hits.
+        Searches run on a small thread pool so network latency overlaps,
+        while the shared rate limiter keeps the request rate within NCBI's
+        limit; titles for all pairs are then fetched in one efetch call.
+
         Args:
             top_k: Number of predictions to validate
-            rate_limit_delay: Delay between API calls (seconds)
+            rate_limit_delay: Minimum delay between API calls (seconds);
+                defaults to NCBI's limit for the configured API key
 
         Returns:
             DataFrame with validation results
         """
+        if rate_limit_delay is not None:
+            self.rate_limiter.interval = rate_limit_delay
+        max_workers = self.requests_per_second
+
         print(f"\n🔍 Validating top {top_k} predictions against PubMed...")
-        print(f"   This may take ~{int(top_k * rate_limit_delay / 60)} minutes due to API rate limits")
+        print(f"   This may take ~{int(top_k * self.rate_limiter.interval / 60)} minutes due to API rate limits")
+        print(f"   Using {max_workers} concurrent requests")
         print()
 
-        validation_results = []
-
-        for idx, row in self.predictions_df.head(top_k).iterrows():
-            drug = row['drug']
-            disease = row['disease']
-            confidence = row['confidence']
-            rank = row['rank']
-
-            print(f"   [{rank}/{top_k}] Searching: {drug} + {disease}...", end='')
-
-            # Search PubMed
-            pubmed_result = self.search_pubmed(drug, disease)
-            count = pubmed_result['count']
-            titles = pubmed_result['titles']
-
-            # Classify
-            validation_status = self.classify_prediction(count)
-
-            print(f" {count} papers → {validation_status}")
-
-            validation_results.append({
-                'rank': rank,
-                'drug': drug,
-                'disease': disease,
-                'confidence': confidence,
-                'pubmed_count': count,
-                'validation_status': validation_status,
-                'sample_titles': titles
-            })
-
-            # Rate limiting
-            time.sleep(rate_limit_delay)
+        top = self.predictions_df.head(top_k)
+        pairs = list(zip(top['drug'], top['disease']))
+
+        # Group uncached diseases by drug; drugs with a single disease skip the group search
+        diseases_by_drug = defaultdict(dict)
+        cached_pairs = 0
+        for drug, disease in pairs:
+            if self.cache_get(pair_query(drug, disease)) is not None:
+                cached_pairs += 1
+            else:
+                diseases_by_drug[drug][disease] = None
+        drug_groups = []
+        for drug, diseases in diseases_by_drug.items():
+            diseases = list(diseases)
+            if len(diseases) > 1:
+                drug_groups.extend((drug, diseases[i:i + MAX_DISEASES_PER_QUERY])
+                                   for i in range(0, len(diseases), MAX_DISEASES_PER_QUERY))
+
+        if self.cache is not None:
+            print(f"   💾 {cached_pairs}/{len(pairs)} pairs served from cache ({self.cache.directory})")
+
+        # executor.map yields results in submission order
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            print(f"   Running {len(drug_groups)} grouped drug searches...")
+            pair_history = {}
+            for (drug, diseases), group in zip(drug_groups, executor.map(lambda g: self.search_drug(*g), drug_groups)):
+                for disease in diseases:
+                    pair_history[(drug, disease)] = group
+
+            def search_pair(pair):
+                group = pair_history.get(pair)
+                if group is not None and group['count'] == 0:
+                    # No paper mentions the drug with any disease in its group
+                    return {'count': 0, 'pmids': []}
+                return self.search_pubmed(*pair, history=group)
+
+            pubmed_results = list(executor.map(search_pair, pairs))
+
+        # Fill typed result columns by index instead of building one dict per row
+        counts = np.empty(len(pairs), dtype=np.int32)
+        pmid_lists = [None] * len(pairs)
+        for i, pubmed_result in enumerate(pubmed_results):
+            counts[i] = pubmed_result['count']
+            pmid_lists[i] = pubmed_result['pmids']
+
+        validation_df = pd.DataFrame({
+            'rank': top['rank'].to_numpy(),
+            'drug': top['drug'].to_numpy(),
+            'disease': top['disease'].to_numpy(),
+            'confidence': top['confidence'].to_numpy(),
+            'pubmed_count': counts,
+            'pmids': pmid_lists
+        })
+
+        # Classify all predictions at once
+        validation_df['validation_status'] = self.classify_predictions(validation_df['pubmed_count'].to_numpy())
+
+        for rank, drug, disease, count, validation_status in zip(
+                validation_df['rank'], validation_df['drug'], validation_df['disease'],
+                validation_df['pubmed_count'], validation_df['validation_status']):
+            print(f"   [{rank}/{top_k}] {drug} + {disease}: {count} papers → {validation_status}")
+
+        # Fetch sample titles for every search in one batched request
+        all_pmids = [pmid for pmids in validation_df['pmids'] for pmid in pmids]
+        print(f"\n📰 Fetching titles for {len(all_pmids)} articles...")
+        titles = self.fetch_titles(all_pmids)
+        validation_df['sample_titles'] = [[titles[pmid] for pmid in pmids if pmid in titles]
+                                          for pmids in validation_df.pop('pmids')]
 
-        validation_df = pd.DataFrame(validation_results)
         return validation_df
 
     def generate_summary(self, validation_df):
         """Generate validation summary statistics."""
         summary = {
             'total_validated': len(validation_df),
-            'confirmed': (validation_df['validation_status'] == 'Confirmed').sum(),
-            'emerging': (validation_df['validation_status'] == 'Emerging').sum(),
-            'novel': (validation_df['validation_status'] == 'Novel').sum(),
+            'confirmed': int((validation_df['validation_status'] == 'Confirmed').sum()),
+            'emerging': int((validation_df['validation_status'] == 'Emerging').sum()),
+            'novel': int((validation_df['validation_status'] == 'Novel').sum()),
             'avg_confidence': float(validation_df['confidence'].mean()),
             'avg_pubmed_count': float(validation_df['pubmed_count'].mean()),
             'max_pubmed_count': int(validation_df['pubmed_count'].max()),
@@ -172,7 +373,12 @@ class PredictionValidator:
 def main():
     parser = argparse.ArgumentParser(description='Validate predictions against PubMed')
     parser.add_argument('--top-k', type=int, default=100, help='Number of predictions to validate')
-    parser.add_argument('--rate-limit', type=float, default=0.5, help='Delay between API calls (seconds)')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='Minimum delay between API calls in seconds (default: NCBI limit, 1/3 s or 1/10 s with --api-key)')
+    parser.add_argument('--api-key', type=str, default=None, help='NCBI API key (raises the rate limit to 10 requests/s)')
+    parser.add_argument('--cache-dir', type=str, default=PUBMED_CACHE_DIR,
+                        help='Directory for the on-disk PubMed response cache')
+    parser.add_argument('--no-cache', action='store_true', help='Always query PubMed, bypassing the response cache')
 
     args = parser.parse_args()
 
@@ -181,7 +387,8 @@ def main():
     print("=" * 70)
 
     # Initialize validator
-    validator = PredictionValidator()
+    validator = PredictionValidator(api_key=args.api_key,
+                                    cache_dir=None if args.no_cache else args.cache_dir)
 
     # Validate predictions
     validation_df = validator.validate_predictions(
@@ -199,7 +406,14 @@ def main():
     # Save validation report
     validation_path = 'data/results/validation_report.csv'
     Path(validation_path).parent.mkdir(parents=True, exist_ok=True)
-    validation_df.to_csv(validation_path, index=False)
+    # Arrow's CSV writer is multi-threaded. pyarrow is a hard requirement, so the
+    # pandas fallback only covers columns Arrow cannot convert (e.g. mixed types).
+    # Title lists are written in their Python repr, as pandas would
+    report_df = validation_df.assign(sample_titles=validation_df['sample_titles'].map(str))
+    try:
+        pacsv.write_csv(pa.Table.from_pandas(report_df, preserve_index=False), validation_path)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        report_df.to_csv(validation_path, index=False)
     print(f"   ✅ Validation report: {validation_path}")
 
     # Save summary